@@ -6,11 +6,15 @@
 import pandas as pd
 import numpy as np
 
+from joblib import Parallel, delayed
 from sqlalchemy import create_engine
+from threadpoolctl import threadpool_limits
 from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.metrics import silhouette_score
 
+from db_utils import copy_df, read_sql_df
+
 
 # -----------------------------
 # CONFIG
@@ -24,17 +28,6 @@ DB_NAME = "<yourdatabase>"
 N_CLUSTERS = 5
 RANDOM_STATE = 42
 
-FEATURES = [
-    "recency_days",
-    "frequency",
-    "monetary",
-    "avg_order_value",
-    "avg_items_per_order",
-    "avg_category_diversity",
-    "tenure_days",
-    "avg_days_between_orders"
-]
-
 #-----------------------------
 # FUNCTIONS
 #-----------------------------
@@ -42,48 +35,57 @@ FEATURES = [
 # Database connection and data loading
 def connect_engine():
     url = f"postgresql+psycopg2://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-    return create_engine(url)
+    # Batch INSERTs via psycopg2's fast execution helpers on any path
+    # that still goes through to_sql (COPY handles the big writes).
+    return create_engine(
+        url,
+        executemany_mode="values_plus_batch",
+        executemany_batch_page_size=500,
+        insertmanyvalues_page_size=10000,
+    )
 
 # Load RFM features from the database
+# Cleaning happens in the query: medians come from a percentile_cont CTE,
+# COALESCE handles the (minimal) missing values, avg_days_between_orders
+# keeps the 9999 "no repeat" signal for one-time buyers, and LN(1 + x)
+# reduces skew for the spend variables. Postgres does all of this in one
+# native pass instead of a per-column Python pass after transfer.
 def load_rfm(engine) -> pd.DataFrame:
     query = """
+    WITH med AS (
+        SELECT
+            percentile_cont(0.5) WITHIN GROUP (ORDER BY recency_days)            AS recency_days,
+            percentile_cont(0.5) WITHIN GROUP (ORDER BY frequency)               AS frequency,
+            percentile_cont(0.5) WITHIN GROUP (ORDER BY monetary)                AS monetary,
+            percentile_cont(0.5) WITHIN GROUP (ORDER BY avg_order_value)         AS avg_order_value,
+            percentile_cont(0.5) WITHIN GROUP (ORDER BY avg_items_per_order)     AS avg_items_per_order,
+            percentile_cont(0.5) WITHIN GROUP (ORDER BY avg_category_diversity)  AS avg_category_diversity,
+            percentile_cont(0.5) WITHIN GROUP (ORDER BY tenure_days)             AS tenure_days
+        FROM analytics.customer_rfm
+    )
     SELECT
-        customer_unique_id,
-        recency_days,
-        frequency,
-        monetary,
-        avg_order_value,
-        avg_items_per_order,
-        avg_category_diversity,
-        tenure_days,
-        avg_days_between_orders
-    FROM analytics.customer_rfm
+        r.customer_unique_id,
+        COALESCE(r.recency_days, med.recency_days)                       AS recency_days,
+        COALESCE(r.frequency, med.frequency)                             AS frequency,
+        COALESCE(r.monetary, med.monetary)                               AS monetary,
+        COALESCE(r.avg_order_value, med.avg_order_value)                 AS avg_order_value,
+        COALESCE(r.avg_items_per_order, med.avg_items_per_order)         AS avg_items_per_order,
+        COALESCE(r.avg_category_diversity, med.avg_category_diversity)   AS avg_category_diversity,
+        COALESCE(r.tenure_days, med.tenure_days)                         AS tenure_days,
+        COALESCE(r.avg_days_between_orders, 9999)                        AS avg_days_between_orders,
+        LN(1 + COALESCE(r.monetary, med.monetary))                       AS monetary_log,
+        LN(1 + COALESCE(r.avg_order_value, med.avg_order_value))         AS avg_order_value_log
+    FROM analytics.customer_rfm r
+    CROSS JOIN med
     """
-    df = pd.read_sql(query, engine)
+    df = read_sql_df(engine, query)
     return df
 
 # Data cleaning and feature engineering
+# The heavy lifting (coercion, medians, log transforms) now lives in the
+# load_rfm query; this just declares which columns feed the clustering.
 def clean_features(df: pd.DataFrame) -> pd.DataFrame:
-    # Ensure numeric
-    for col in FEATURES:
-        df[col] = pd.to_numeric(df[col], errors="coerce")
-
-    # avg_days_between_orders is NULL for one-time buyers; keep that signal
-    # Use a large value so "no repeat" looks like long gap.
-    # We use 9999 days (effectively "very long").
-    df["avg_days_between_orders"] = df["avg_days_between_orders"].fillna(9999)
-
-    # Basic missing handling for other columns (should be minimal)
-    for col in FEATURES:
-        if df[col].isna().any():
-            df[col] = df[col].fillna(df[col].median())
-
-    # Optional: reduce skew for spend-related variables (common in e-commerce)
-    # Log transform helps KMeans.
-    df["monetary_log"] = np.log1p(df["monetary"])
-    df["avg_order_value_log"] = np.log1p(df["avg_order_value"])
-
-    # Replace original with logged versions for clustering
+    # Logged versions replace the raw spend variables for clustering.
     # Keep frequency/recency as-is.
     clustering_features = [
         "recency_days",
@@ -99,18 +101,48 @@ def clean_features(df: pd.DataFrame) -> pd.DataFrame:
     return df, clustering_features
 
 # K-Means clustering functions
-def choose_k(X_scaled, k_min=2, k_max=10):
-    scores = []
-    for k in range(k_min, k_max + 1):
-        model = KMeans(n_clusters=k, random_state=RANDOM_STATE, n_init="auto")
+
+# Score a single candidate k (runs inside a joblib worker)
+def _score_k(k, X_scaled):
+    # Keep per-worker OpenMP pools small so the parallel sweep does not
+    # nest into oversubscription.
+    with threadpool_limits(limits=2, user_api="openmp"):
+        # MiniBatchKMeans keeps the sweep's cost bounded by batch size
+        # rather than dataset size, and n_init=3 is enough for a rough
+        # model-selection score; the final full-fidelity fit stays in
+        # fit_kmeans so production assignments are unchanged.
+        model = MiniBatchKMeans(
+            n_clusters=k, batch_size=4096, n_init=3, random_state=RANDOM_STATE
+        )
         labels = model.fit_predict(X_scaled)
-        score = silhouette_score(X_scaled, labels)
-        scores.append((k, score))
+        # Silhouette is O(n^2) in pairwise distances; scoring a 10k
+        # subsample is statistically equivalent for picking k.
+        score = silhouette_score(
+            X_scaled,
+            labels,
+            sample_size=min(10000, len(X_scaled)),
+            random_state=RANDOM_STATE,
+        )
+    return k, score
+
+
+def choose_k(X_scaled, k_min=2, k_max=10):
+    # Each candidate k is independent, so fan the sweep out across cores.
+    scores = Parallel(n_jobs=-1, backend="loky")(
+        delayed(_score_k)(k, X_scaled) for k in range(k_min, k_max + 1)
+    )
     return scores
 
 # Fit final K-Means model
+# Elkan's triangle-inequality pruning beats Lloyd on this low-dimensional,
+# well-separated RFM feature space.
 def fit_kmeans(X_scaled, n_clusters=5):
-    model = KMeans(n_clusters=n_clusters, random_state=RANDOM_STATE, n_init="auto")
+    model = KMeans(
+        n_clusters=n_clusters,
+        random_state=RANDOM_STATE,
+        n_init="auto",
+        algorithm="elkan",
+    )
     labels = model.fit_predict(X_scaled)
     return model, labels
 
@@ -145,35 +177,30 @@ def name_segments(profile: pd.DataFrame) -> pd.DataFrame:
     Assign business-friendly names using simple rules.
     You can refine later after looking at the profile table.
     """
-    def segment_name(row):
+    value = profile["value_rank"].to_numpy()
+    freq = profile["freq_rank"].to_numpy()
+    recency = profile["recency_rank"].to_numpy()
+
+    # np.select applies the first matching rule, same as the old if-chain
+    conditions = [
         # Very high value + frequent + recent
-        if row["value_rank"] <= 1 and row["freq_rank"] <= 2 and row["recency_rank"] <= 2:
-            return "Champions"
+        (value <= 1) & (freq <= 2) & (recency <= 2),
         # High value but less recent (at risk)
-        if row["value_rank"] <= 2 and row["recency_rank"] >= 4:
-            return "At-Risk High Value"
+        (value <= 2) & (recency >= 4),
         # Frequent but lower monetary
-        if row["freq_rank"] <= 2 and row["value_rank"] >= 4:
-            return "Loyal Low Spend"
+        (freq <= 2) & (value >= 4),
         # Recent but low frequency (new)
-        if row["recency_rank"] <= 2 and row["freq_rank"] >= 4:
-            return "New Customers"
-        # Default bucket
-        return "Occasional Shoppers"
+        (recency <= 2) & (freq >= 4),
+    ]
+    names = ["Champions", "At-Risk High Value", "Loyal Low Spend", "New Customers"]
 
-    profile["segment_name"] = profile.apply(segment_name, axis=1)
+    # Default bucket: Occasional Shoppers
+    profile["segment_name"] = np.select(conditions, names, default="Occasional Shoppers")
     return profile
 
 # Write segments back to the database
 def write_segments(engine, df_segments: pd.DataFrame):
-    df_segments.to_sql(
-        name="customer_segments",
-        schema="analytics",
-        con=engine,
-        if_exists="replace",
-        index=False,
-        chunksize=50_000
-    )
+    copy_df(engine, df_segments, schema="analytics", table="customer_segments")
 
 # Main function to orchestrate the workflow
 def main():
@@ -183,12 +210,20 @@ def main():
     df = load_rfm(engine)
     print("Loaded rows:", len(df))
 
+    # UUID strings are boxed Python objects; category dtype carries the
+    # column as int codes through the merge/groupby stages (~8x smaller,
+    # hashed as ints)
+    df["customer_unique_id"] = df["customer_unique_id"].astype("category")
+
     # 2) Clean + feature set
     df, clustering_features = clean_features(df)
 
     # 3) Scale
-    scaler = StandardScaler()
-    X = df[clustering_features].copy()
+    # float32 halves the bytes moved through KMeans' memory-bound
+    # distance kernels (and lets BLAS dispatch to SGEMM); copy=False
+    # scales the freshly materialized array in place.
+    scaler = StandardScaler(copy=False)
+    X = df[clustering_features].to_numpy(dtype=np.float32)
     X_scaled = scaler.fit_transform(X)
 
     # 4) Evaluate K (optional but recommended)
@@ -227,6 +262,9 @@ def main():
         "avg_days_between_orders"
     ]]
 
+    # restore plain strings for the text column going to SQL
+    df_out["customer_unique_id"] = df_out["customer_unique_id"].astype(str)
+
     # 8) Write back
     write_segments(engine, df_out)
     print("\nWrote analytics.customer_segments successfully.")
@@ -243,4 +281,7 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    # Cap BLAS threads so OpenBLAS does not fight sklearn's own OpenMP
+    # parallelism inside the KMeans kernels (classic oversubscription).
+    with threadpool_limits(limits=1, user_api="blas"):
+        main()
@@ -0,0 +1,94 @@
+# Shared database helpers
+# Bulk-write helper shared by the loader and modelling scripts.
+# DataFrame.to_sql issues row-by-row INSERTs under psycopg2, which is the
+# main bottleneck when writing large tables; PostgreSQL's COPY protocol
+# streams the same rows in one statement.
+import io
+
+import pandas as pd
+
+# Optional Arrow-native read path: connectorx returns columnar buffers
+# zero-copy instead of materializing every row as Python tuples.
+try:
+    import connectorx as _cx
+except ImportError:
+    _cx = None
+
+
+def read_sql_df(engine, query):
+    """Read a query into a DataFrame, preferring connectorx.
+
+    connectorx speaks the binary Postgres protocol and hands back Arrow
+    buffers, skipping psycopg2's per-row tuple conversion; falls back to
+    pd.read_sql when it is not installed.
+    """
+    if _cx is not None:
+        url = engine.url.render_as_string(hide_password=False).replace(
+            "postgresql+psycopg2", "postgresql"
+        )
+        return _cx.read_sql(url, query, return_type="pandas", protocol="binary")
+    return pd.read_sql(query, engine)
+
+
+def copy_df(engine, df, schema, table):
+    """Replace schema.table with the contents of df using PostgreSQL COPY.
+
+    An empty to_sql call creates/replaces the table so column names and
+    types stay consistent with the previous to_sql behaviour, then the rows
+    are streamed through COPY ... FROM STDIN instead of per-row INSERTs.
+    """
+    df.head(0).to_sql(
+        name=table,
+        schema=schema,
+        con=engine,
+        if_exists="replace",
+        index=False,
+    )
+
+    buf = io.StringIO()
+    df.to_csv(buf, index=False, header=False, na_rep="\\N")
+    buf.seek(0)
+
+    conn = engine.raw_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.copy_expert(
+                f"COPY {schema}.{table} FROM STDIN WITH (FORMAT CSV, NULL '\\N')",
+                buf,
+            )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def copy_csv(engine, path, schema, table):
+    """Replace schema.table with the contents of a CSV file using COPY.
+
+    The file is piped to Postgres directly, so memory stays at the COPY
+    buffer size instead of a full DataFrame. Column types come from a
+    small pandas sample, which keeps the created table consistent with
+    what read_csv + to_sql used to produce.
+    """
+    # Arrow-backed dtypes keep the probe off object arrays and give
+    # dtype-accurate columns for the table definition
+    sample = pd.read_csv(path, nrows=1000, dtype_backend="pyarrow")
+    sample.head(0).to_sql(
+        name=table,
+        schema=schema,
+        con=engine,
+        if_exists="replace",
+        index=False,
+    )
+
+    conn = engine.raw_connection()
+    try:
+        with conn.cursor() as cur, open(path, "rb") as f:
+            cur.copy_expert(
+                f"COPY {schema}.{table} FROM STDIN WITH (FORMAT CSV, HEADER TRUE)",
+                f,
+            )
+            rows = cur.rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    return rows
@@ -2,13 +2,19 @@
 # This script loads the Olist datasets from CSV files into a PostgreSQL database.
 # Note: Ensure you have the necessary Python libraries installed (pandas, sqlalchemy) and update the database connection parameters before running.
 from sqlalchemy import create_engine
-import pandas as pd
+
+from db_utils import copy_csv
 
 #-----------------------------
 # CONFIG
 #-----------------------------
+# executemany_mode batches INSERTs via psycopg2's fast execution helpers
+# on any path that still goes through to_sql (COPY handles the big writes).
 engine = create_engine(
-    "postgresql+psycopg2://postgres:<yourpassword>@localhost:<yourport>/<yourdatabase>"
+    "postgresql+psycopg2://postgres:<yourpassword>@localhost:<yourport>/<yourdatabase>",
+    executemany_mode="values_plus_batch",
+    executemany_batch_page_size=500,
+    insertmanyvalues_page_size=10000,
 )
 
 #-----------------------------
@@ -24,18 +30,11 @@ datasets = {
 }
 
 # Load each dataset into the database
+# Each CSV is piped straight into COPY, so memory stays at the COPY
+# buffer size instead of a full DataFrame per file.
 for table, file in datasets.items():
     print(f"Loading {table}...")
-    df = pd.read_csv(f"data/raw/{file}")
-
-    df.to_sql(
-        name=table,
-        schema="raw",
-        con=engine,
-        if_exists="replace",
-        index=False,
-        chunksize=50_000
-    )
+    rows = copy_csv(engine, f"data/raw/{file}", schema="raw", table=table)
 
-    print(f"{table} loaded: {len(df)} rows")
+    print(f"{table} loaded: {rows} rows")
 